@@ -1,20 +1,26 @@
 ## agents/email_agent.py
 import requests
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from .base_agent import BaseAgent
 
 class EmailAgent(BaseAgent):
     """Agent for sending email notifications using Elastic Email"""
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], session: Optional[requests.Session] = None):
         super().__init__(config)
+        # HTTP session (connection pool) - may be shared between tenants,
+        # the API key is sent in the payload; a shared session must not keep cookies
+        self.session = session or requests.Session()
         self.api_key = config["elastic_email"]["api_key"]
         self.base_url = config["elastic_email"]["base_url"]
         self.from_email = config["notification_email"]["from_email"]
         self.from_name = config["notification_email"]["from_name"]
     
-    def execute(self, task: Dict[str, Any]) -> Dict[str, Any]:
-        """Send email notification"""
+    def execute(self, task: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Send email notification
+
+        timeout bounds the HTTP call in seconds (None waits indefinitely).
+        """
         try:
             # Extract notification details
             operation_result = task.get("operation_result", {})
@@ -27,13 +33,17 @@ class EmailAgent(BaseAgent):
             # Default recipient
             recipient = notification_details.get("recipient", "admin@company.com")
             
-            return self.send_email(recipient, subject, body)
+            return self.send_email(recipient, subject, body, timeout=timeout)
             
+        except requests.Timeout as e:
+            self.logger.error(f"Email sending timed out: {str(e)}")
+            return {"status": "error", "error": f"Timed out: {str(e)}", "deadline_exceeded": True}
         except Exception as e:
             self.logger.error(f"Email sending failed: {str(e)}")
             return {"status": "error", "error": str(e)}
     
-    def send_email(self, to_email: str, subject: str, body: str) -> Dict[str, Any]:
+    def send_email(self, to_email: str, subject: str, body: str,
+                   timeout: Optional[float] = None) -> Dict[str, Any]:
         """Send email using Elastic Email API"""
         url = f"{self.base_url}/email/send"
         
@@ -49,7 +59,7 @@ class EmailAgent(BaseAgent):
         
         self.log_action("send_email", {"to": to_email, "subject": subject})
         
-        response = requests.post(url, data=payload)
+        response = self.session.post(url, data=payload, timeout=timeout)
         
         if response.status_code == 200:
             result = response.json()
@@ -6,8 +6,11 @@ from .base_agent import BaseAgent
 class HubSpotAgent(BaseAgent):
     """Agent for managing HubSpot CRM operations"""
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], session: Optional[requests.Session] = None):
         super().__init__(config)
+        # HTTP session (connection pool) - may be shared between tenants,
+        # credentials are sent per request; a shared session must not keep cookies
+        self.session = session or requests.Session()
         self.api_key = config["hubspot"]["api_key"]
         self.base_url = config["hubspot"]["base_url"]
         self.headers = {
@@ -15,28 +18,40 @@ class HubSpotAgent(BaseAgent):
             "Content-Type": "application/json"
         }
     
-    def execute(self, task: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute HubSpot CRM operations"""
+    def execute(self, task: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Execute HubSpot CRM operations
+
+        timeout bounds the HTTP call in seconds (None waits indefinitely).
+        """
         task_type = task.get("task_type")
         parameters = task.get("parameters", {})
         
         try:
             if task_type == "create_contact":
-                return self.create_contact(parameters)
+                return self.create_contact(parameters, timeout=timeout)
             elif task_type == "update_contact":
-                return self.update_contact(parameters)
+                return self.update_contact(parameters, timeout=timeout)
             elif task_type == "create_deal":
-                return self.create_deal(parameters)
+                return self.create_deal(parameters, timeout=timeout)
             elif task_type == "update_deal":
-                return self.update_deal(parameters)
+                return self.update_deal(parameters, timeout=timeout)
             else:
                 return {"status": "error", "error": f"Unknown task type: {task_type}"}
                 
+        except requests.Timeout as e:
+            # The request may still have been applied by HubSpot
+            self.logger.error(f"HubSpot operation timed out: {str(e)}")
+            return {
+                "status": "error",
+                "operation": task_type,
+                "error": f"Timed out: {str(e)}",
+                "deadline_exceeded": True
+            }
         except Exception as e:
             self.logger.error(f"HubSpot operation failed: {str(e)}")
             return {"status": "error", "error": str(e)}
     
-    def create_contact(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    def create_contact(self, parameters: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
         """Create a new contact in HubSpot"""
         url = f"{self.base_url}/crm/v3/objects/contacts"
         
@@ -56,7 +71,7 @@ class HubSpotAgent(BaseAgent):
         
         self.log_action("create_contact", {"properties": properties})
         
-        response = requests.post(url, headers=self.headers, json=payload)
+        response = self.session.post(url, headers=self.headers, json=payload, timeout=timeout)
         
         if response.status_code == 201:
             contact_data = response.json()
@@ -73,7 +88,7 @@ class HubSpotAgent(BaseAgent):
                 "error": response.text
             }
     
-    def update_contact(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    def update_contact(self, parameters: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
         """Update an existing contact in HubSpot"""
         contact_id = parameters.get("contact_id")
         if not contact_id:
@@ -97,7 +112,7 @@ class HubSpotAgent(BaseAgent):
         
         self.log_action("update_contact", {"contact_id": contact_id, "properties": properties})
         
-        response = requests.patch(url, headers=self.headers, json=payload)
+        response = self.session.patch(url, headers=self.headers, json=payload, timeout=timeout)
         
         if response.status_code == 200:
             contact_data = response.json()
@@ -114,7 +129,7 @@ class HubSpotAgent(BaseAgent):
                 "error": response.text
             }
     
-    def create_deal(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    def create_deal(self, parameters: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
         """Create a new deal in HubSpot"""
         url = f"{self.base_url}/crm/v3/objects/deals"
         
@@ -132,7 +147,7 @@ class HubSpotAgent(BaseAgent):
         
         self.log_action("create_deal", {"properties": properties})
         
-        response = requests.post(url, headers=self.headers, json=payload)
+        response = self.session.post(url, headers=self.headers, json=payload, timeout=timeout)
         
         if response.status_code == 201:
             deal_data = response.json()
@@ -149,7 +164,7 @@ class HubSpotAgent(BaseAgent):
                 "error": response.text
             }
     
-    def update_deal(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    def update_deal(self, parameters: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
         """Update an existing deal in HubSpot"""
         deal_id = parameters.get("deal_id")
         if not deal_id:
@@ -169,7 +184,7 @@ class HubSpotAgent(BaseAgent):
         
         self.log_action("update_deal", {"deal_id": deal_id, "properties": properties})
         
-        response = requests.patch(url, headers=self.headers, json=payload)
+        response = self.session.patch(url, headers=self.headers, json=payload, timeout=timeout)
         
         if response.status_code == 200:
             deal_data = response.json()
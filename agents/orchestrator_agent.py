@@ -1,5 +1,5 @@
 ## agents/orchestrator_agent.py
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
@@ -7,6 +7,8 @@ from langchain.schema import BaseOutputParser
 import json
 import re
 import os
+from llm_scheduler import LLMScheduler, RateLimitExceeded, scheduled_client_kwargs
+from deadline import DeadlineExceeded
 from .base_agent import BaseAgent
 
 class TaskOutputParser(BaseOutputParser):
@@ -40,18 +42,26 @@ class TaskOutputParser(BaseOutputParser):
 class OrchestratorAgent(BaseAgent):
     """Global orchestrator agent that delegates tasks to specialized agents"""
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], llm: Optional[ChatOpenAI] = None,
+                 scheduler: Optional[LLMScheduler] = None):
         super().__init__(config)
-        # Set API key in environment if not already there
-        if "OPENAI_API_KEY" not in os.environ:
+        # Set API key in environment if not already there. Skipped for an
+        # injected (shared) client, which would leak one tenant's key into
+        # every client built without an explicit key
+        if llm is None and "OPENAI_API_KEY" not in os.environ:
             os.environ["OPENAI_API_KEY"] = config["openai"]["api_key"]
             
-        # Initialize with ChatOpenAI from langchain_openai
-        self.llm = ChatOpenAI(
+        # Initialize with ChatOpenAI from langchain_openai, unless a shared
+        # client for the same credentials was provided
+        self.llm = llm or ChatOpenAI(
             api_key=config["openai"]["api_key"],
             model=config["openai"]["model"],
-            temperature=0.1
+            temperature=0.1,
+            **scheduled_client_kwargs(ChatOpenAI)
         )
+        # Admits calls against the TPM/RPM budgets, shared by all workflows
+        # using the same API key and model
+        self.scheduler = scheduler or LLMScheduler.from_config(config)
         self.parser = TaskOutputParser()
         self.prompt_template = ChatPromptTemplate.from_template("""
 You are a CRM automation orchestrator. Analyze the user query and determine what CRM operations need to be performed.
@@ -84,7 +94,8 @@ Based on the query, respond with a JSON object containing:
 Only include parameters that are actually mentioned or can be inferred from the query.
 """)
     
-    def execute(self, user_query: str) -> Dict[str, Any]:
+    def execute(self, user_query: str, priority: int = 0,
+                deadline: Optional[float] = None) -> Dict[str, Any]:
         """Analyze user query and create execution plan"""
         try:
             self.log_action("analyze_query", {"query": user_query})
@@ -101,8 +112,10 @@ Only include parameters that are actually mentioned or can be inferred from the
                 # Generate task plan using LLM
                 prompt = self.prompt_template.invoke({"user_query": user_query})
                 
-                # Use the ChatOpenAI model to get a response
-                ai_response = self.llm.invoke(prompt)
+                # Use the ChatOpenAI model to get a response, once the
+                # scheduler admits the call
+                ai_response = self.scheduler.invoke(self.llm, prompt, priority=priority,
+                                                     deadline=deadline)
                 
                 # Extract the content from the response
                 response_text = ai_response.content if hasattr(ai_response, 'content') else str(ai_response)
@@ -111,6 +124,22 @@ Only include parameters that are actually mentioned or can be inferred from the
                 task_plan = self.parser.parse(response_text)
                 
                 self.log_action("task_plan_created", task_plan)
+            except DeadlineExceeded as e:
+                self.logger.error(f"Deadline exceeded while generating task plan: {str(e)}")
+                return {
+                    "status": "error",
+                    "error": str(e),
+                    "task_plan": None,
+                    "deadline_exceeded": True
+                }
+            except RateLimitExceeded as e:
+                # Report rate limiting instead of planning an unknown task
+                self.logger.error(f"Rate limited while generating task plan: {str(e)}")
+                return {
+                    "status": "error",
+                    "error": str(e),
+                    "task_plan": None
+                }
             except Exception as e:
                 self.logger.error(f"Error generating task plan: {str(e)}")
                 task_plan = default_task
@@ -129,6 +158,7 @@ Only include parameters that are actually mentioned or can be inferred from the
                 "task_plan": None
             }
     
-    def orchestrate(self, user_query: str) -> Dict[str, Any]:
+    def orchestrate(self, user_query: str, priority: int = 0,
+                    deadline: Optional[float] = None) -> Dict[str, Any]:
         """Alias for execute method to match the node name in the workflow"""
-        return self.execute(user_query)
\ No newline at end of file
+        return self.execute(user_query, priority=priority, deadline=deadline)
\ No newline at end of file
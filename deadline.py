@@ -0,0 +1,31 @@
+## deadline.py
+from typing import Optional
+import time
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's deadline passed before the work could finish"""
+
+def make_deadline(timeout: Optional[float]) -> Optional[float]:
+    """Absolute deadline (monotonic clock) for a timeout in seconds"""
+    return time.monotonic() + timeout if timeout is not None else None
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left before the deadline, None when there is no deadline"""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+def timeout_for(deadline: Optional[float]) -> Optional[float]:
+    """Time left to use as a call timeout, None when there is no deadline
+
+    Raises DeadlineExceeded once no time is left, since HTTP clients reject
+    a zero timeout rather than failing fast.
+    """
+    left = remaining(deadline)
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("Deadline exceeded")
+    return left
+
+def expired(deadline: Optional[float]) -> bool:
+    """Whether the deadline has passed"""
+    return deadline is not None and time.monotonic() >= deadline
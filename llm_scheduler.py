@@ -0,0 +1,282 @@
+## llm_scheduler.py
+from typing import Dict, Any, Optional, Mapping
+import heapq
+import itertools
+import logging
+import math
+import re
+import threading
+import time
+from deadline import DeadlineExceeded, expired, timeout_for
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a character based estimate
+    tiktoken = None
+
+class RateLimitExceeded(Exception):
+    """Raised when a call could not be admitted or kept hitting rate limits"""
+
+class LLMScheduler:
+    """Admits LLM calls against tokens-per-minute and requests-per-minute budgets
+
+    Every call estimates its prompt and completion tokens up front and waits
+    in a priority queue (higher priority first, FIFO within a priority) until
+    both budgets can cover it. Budgets refill continuously over a minute and
+    are corrected from OpenAI's x-ratelimit-* response headers. A limit left
+    as None is not enforced until a response header reports it.
+    """
+
+    def __init__(self, tpm_limit: Optional[int] = None, rpm_limit: Optional[int] = None,
+                 completion_tokens: int = 400, max_retries: int = 3,
+                 queue_timeout: Optional[float] = None):
+        self.tpm_limit = tpm_limit
+        self.rpm_limit = rpm_limit
+        self.completion_tokens = completion_tokens
+        self.max_retries = max_retries
+        self.queue_timeout = queue_timeout
+
+        # Available budget, refilled at limit / 60 per second up to the limit
+        self._tokens = float(tpm_limit) if tpm_limit else math.inf
+        self._requests = float(rpm_limit) if rpm_limit else math.inf
+        self._refilled_at = time.monotonic()
+        # No call is admitted before this time (set after a 429)
+        self._blocked_until = 0.0
+
+        self._queue = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._encoding = None
+        self._warned_no_headers = False
+        self.logger = logging.getLogger(__name__)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "LLMScheduler":
+        """Build a scheduler from the "rate_limits" section of the openai config"""
+        limits = config.get("openai", {}).get("rate_limits", {})
+        return cls(
+            tpm_limit=limits.get("tpm"),
+            rpm_limit=limits.get("rpm"),
+            completion_tokens=limits.get("completion_tokens", 400),
+            max_retries=limits.get("max_retries", 3),
+            queue_timeout=limits.get("queue_timeout")
+        )
+
+    def estimate_tokens(self, llm: Any, prompt: Any) -> int:
+        """Estimate prompt plus completion tokens for a call"""
+        text = prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+        if tiktoken is not None:
+            if self._encoding is None:
+                try:
+                    self._encoding = tiktoken.encoding_for_model(getattr(llm, "model_name", ""))
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("cl100k_base")
+            prompt_tokens = len(self._encoding.encode(text))
+        else:
+            prompt_tokens = len(text) // 4 + 1
+        # Chat formatting adds a few tokens per message
+        prompt_tokens += 8
+        completion_tokens = getattr(llm, "max_tokens", None) or self.completion_tokens
+        return prompt_tokens + completion_tokens
+
+    def invoke(self, llm: Any, prompt: Any, priority: int = 0,
+               timeout: Optional[float] = None, deadline: Optional[float] = None) -> Any:
+        """Invoke the LLM once the call fits in the budgets, retrying on 429s
+
+        With a request deadline, queueing and retries stop once it passes and
+        the API call itself is given the remaining time as its timeout. That
+        only bounds the whole call if the client does not retry on its own,
+        so build it with scheduled_client_kwargs (max_retries=0).
+        """
+        estimate = self.estimate_tokens(llm, prompt)
+        for attempt in range(self.max_retries + 1):
+            self._acquire(estimate, priority, timeout, deadline)
+            try:
+                if deadline is not None:
+                    response = llm.invoke(prompt, timeout=timeout_for(deadline))
+                else:
+                    response = llm.invoke(prompt)
+            except Exception as e:
+                if not _is_rate_limit_error(e):
+                    # The request may not have reached the API, give it back
+                    self._release(estimate)
+                    if expired(deadline):
+                        raise DeadlineExceeded("Deadline exceeded during LLM call") from e
+                    raise
+                headers = getattr(getattr(e, "response", None), "headers", None) or {}
+                self.update_from_headers(headers)
+                self._block(_retry_after(headers, default=2.0 ** attempt))
+                self.logger.warning(f"Rate limited (attempt {attempt + 1}): {str(e)}")
+                continue
+
+            # Settle the estimate against actual usage first, so the server's
+            # remaining counts (which include this call) are applied last
+            metadata = getattr(response, "response_metadata", None) or {}
+            usage = metadata.get("token_usage") or {}
+            if usage.get("total_tokens"):
+                self._release(estimate - usage["total_tokens"])
+            headers = metadata.get("headers")
+            if headers:
+                self.update_from_headers(headers)
+            elif not self._warned_no_headers:
+                self._warned_no_headers = True
+                self.logger.warning(
+                    "LLM responses carry no rate limit headers (needs a langchain_openai "
+                    "with include_response_headers); budgets stay at the configured "
+                    f"values: tpm={self.tpm_limit}, rpm={self.rpm_limit}"
+                )
+            return response
+
+        raise RateLimitExceeded(f"Still rate limited after {self.max_retries + 1} attempts")
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        """Adjust budgets from x-ratelimit-* response headers"""
+        if not headers:
+            return
+        headers = {k.lower(): v for k, v in headers.items()}
+        with self._cond:
+            self._refill()
+            limit = _to_int(headers.get("x-ratelimit-limit-tokens"))
+            if limit:
+                self.tpm_limit = limit
+            limit = _to_int(headers.get("x-ratelimit-limit-requests"))
+            if limit:
+                self.rpm_limit = limit
+            # A newly learned limit caps the budget that was unlimited so far
+            if self.tpm_limit:
+                self._tokens = min(self._tokens, float(self.tpm_limit))
+            if self.rpm_limit:
+                self._requests = min(self._requests, float(self.rpm_limit))
+            # The server's view of what is left wins over ours when it is lower
+            # (only once the limit is known, an unknown one is not enforced)
+            tokens_left = _to_int(headers.get("x-ratelimit-remaining-tokens"))
+            if tokens_left is not None and self.tpm_limit:
+                self._tokens = min(self._tokens, float(tokens_left))
+            requests_left = _to_int(headers.get("x-ratelimit-remaining-requests"))
+            if requests_left is not None and self.rpm_limit:
+                self._requests = min(self._requests, float(requests_left))
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Current budgets and queue length for monitoring"""
+        with self._cond:
+            self._refill()
+            return {
+                "tpm_limit": self.tpm_limit,
+                "rpm_limit": self.rpm_limit,
+                "tokens_available": int(self._tokens) if self.tpm_limit else None,
+                "requests_available": int(self._requests) if self.rpm_limit else None,
+                "queued": len(self._queue)
+            }
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        if self.tpm_limit:
+            self._tokens = min(float(self.tpm_limit), self._tokens + elapsed * self.tpm_limit / 60.0)
+        if self.rpm_limit:
+            self._requests = min(float(self.rpm_limit), self._requests + elapsed * self.rpm_limit / 60.0)
+
+    def _acquire(self, tokens: int, priority: int, timeout: Optional[float],
+                 request_deadline: Optional[float] = None):
+        timeout = timeout if timeout is not None else self.queue_timeout
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        if request_deadline is not None and (deadline is None or request_deadline < deadline):
+            deadline = request_deadline
+        else:
+            request_deadline = None
+        entry = (-priority, next(self._counter))
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    self._refill()
+                    now = time.monotonic()
+                    if self._queue[0] == entry and now >= self._blocked_until:
+                        # A call larger than the whole budget could never be
+                        # admitted; the limit may change with every header
+                        needed = min(tokens, self.tpm_limit) if self.tpm_limit else tokens
+                        if self._tokens >= needed and self._requests >= 1:
+                            self._tokens -= needed
+                            self._requests -= 1
+                            return
+                        waits = [0.0]
+                        if self.tpm_limit:
+                            waits.append((needed - self._tokens) * 60.0 / self.tpm_limit)
+                        if self.rpm_limit:
+                            waits.append((1 - self._requests) * 60.0 / self.rpm_limit)
+                        wait = max(waits)
+                    elif self._queue[0] == entry:
+                        wait = self._blocked_until - now
+                    else:
+                        wait = None
+                    if deadline is not None:
+                        if now >= deadline and request_deadline is not None:
+                            raise DeadlineExceeded("Deadline exceeded waiting for LLM rate limit budget")
+                        if now >= deadline:
+                            raise RateLimitExceeded("Timed out waiting for LLM rate limit budget")
+                        wait = min(wait, deadline - now) if wait is not None else deadline - now
+                    self._cond.wait(wait)
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def _release(self, tokens: float):
+        """Return unused (or charge extra, if negative) tokens to the budget"""
+        with self._cond:
+            self._refill()
+            self._tokens = min(float(self.tpm_limit or math.inf), self._tokens + tokens)
+            self._cond.notify_all()
+
+    def _block(self, seconds: float):
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    if getattr(error, "status_code", None) == 429:
+        return True
+    return type(error).__name__ == "RateLimitError"
+
+def _to_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _retry_after(headers: Mapping[str, str], default: float) -> float:
+    """Seconds to wait after a 429, from retry-after or the reset headers"""
+    headers = {k.lower(): v for k, v in headers.items()}
+    try:
+        return float(headers["retry-after"])
+    except (KeyError, TypeError, ValueError):
+        pass
+    resets = [_parse_duration(headers.get(name))
+              for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+    resets = [r for r in resets if r is not None]
+    return max(resets) if resets else default
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset durations such as "1s", "6m0s" or "120ms" """
+    if not value:
+        return None
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not parts:
+        return None
+    scale = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+def scheduled_client_kwargs(model_cls: Any) -> Dict[str, Any]:
+    """ChatOpenAI kwargs for a client whose calls go through LLMScheduler
+
+    SDK retries are disabled so every attempt is counted against the budgets
+    and every 429 reaches the scheduler. Rate limit headers are exposed when
+    the installed version supports it.
+    """
+    kwargs: Dict[str, Any] = {"max_retries": 0}
+    fields = getattr(model_cls, "model_fields", None) or getattr(model_cls, "__fields__", {})
+    if "include_response_headers" in fields:
+        kwargs["include_response_headers"] = True
+    return kwargs
@@ -34,9 +34,13 @@ def main():
             print("📊 WORKFLOW RESULTS")
             print("=" * 50)
             
-            if result["status"] == "completed":
+            if result["status"] in ("completed", "partial"):
                 print(f"✅ Status: {result['workflow_successful'] and 'SUCCESS' or 'PARTIAL'}")
                 
+                if result.get("deadline_exceeded"):
+                    stopped = result["cancelled_nodes"] + result["skipped_nodes"]
+                    print(f"⏱️  Deadline exceeded, not completed: {', '.join(stopped)}")
+                
                 # Show task plan
                 if result.get("task_plan"):
                     task_plan = result["task_plan"]
@@ -50,6 +54,8 @@ def main():
                         print(f"   └─ Contact ID: {hubspot_result['contact_id']}")
                     if hubspot_result.get("deal_id"):
                         print(f"   └─ Deal ID: {hubspot_result['deal_id']}")
+                elif hubspot_result.get("status") == "skipped":
+                    print(f"🎯 HubSpot: Operation skipped")
                 else:
                     print(f"❌ HubSpot: {hubspot_result.get('error', 'Operation failed')}")
                 
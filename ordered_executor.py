@@ -0,0 +1,249 @@
+## ordered_executor.py
+from typing import Dict, Any, Optional, List
+from concurrent.futures import Future, ThreadPoolExecutor
+from workflow import CRMWorkflow
+from deadline import make_deadline
+import logging
+import queue
+import threading
+import time
+import zlib
+
+def entity_key(task_plan: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Key of the HubSpot entity a task plan writes to (None for new deals)
+
+    Contacts are keyed by ID when updating, otherwise by email. A contact
+    created by email and later updated by ID gets two different keys, so
+    those two requests are not ordered against each other.
+    """
+    if not task_plan:
+        return None
+    task_type = task_plan.get("task_type") or ""
+    parameters = task_plan.get("parameters") or {}
+    if "contact" in task_type:
+        if parameters.get("contact_id"):
+            return f"contact:{parameters['contact_id']}"
+        if parameters.get("email"):
+            return f"contact:email:{str(parameters['email']).strip().lower()}"
+    elif "deal" in task_type:
+        if parameters.get("deal_id"):
+            return f"deal:{parameters['deal_id']}"
+    return None
+
+class ExecutorFull(RuntimeError):
+    """Raised by a non-blocking submit when max_in_flight requests are running"""
+
+class _Shard:
+    """One worker thread applying HubSpot operations in FIFO order"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.queue: "queue.Queue" = queue.Queue()
+        self.processed = 0
+        self.max_depth = 0
+        self.busy = False
+
+class OrderedEntityExecutor:
+    """Runs CRMWorkflow requests in parallel while ordering writes per entity
+
+    Planning runs on a thread pool. Planned requests are then handed to the
+    HubSpot phase in submission order, sharded by entity key: one worker per
+    shard keeps requests for the same contact or deal strictly ordered,
+    while different keys run in parallel. Notifications run on their own
+    small pool, so they neither hold up a shard nor wait behind planning.
+
+    At most max_in_flight requests are held at once (planning, waiting for
+    an earlier request's plan, queued on a shard or notifying); submit
+    blocks beyond that, which bounds every queue in the executor.
+    """
+
+    def __init__(self, workflow: CRMWorkflow, num_shards: int = 8, planning_workers: int = 16,
+                 max_in_flight: int = 1000, notify_workers: int = 4):
+        self.workflow = workflow
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self.logger = logging.getLogger(__name__)
+        self._pool = ThreadPoolExecutor(max_workers=planning_workers,
+                                        thread_name_prefix="crm-plan")
+        self._notify_pool = ThreadPoolExecutor(max_workers=notify_workers,
+                                               thread_name_prefix="crm-notify")
+
+        # Planned requests wait here until every earlier request is planned,
+        # since the entity key is only known after planning
+        self._lock = threading.Lock()
+        self._next_submit = 0
+        self._next_dispatch = 0
+        self._planned: Dict[int, tuple] = {}
+        # seq -> submit time of requests not yet dispatched to a shard
+        self._submitted_at: Dict[int, float] = {}
+        self._in_flight = 0
+        self._shutdown = False
+
+        self._shards: List[_Shard] = [_Shard(i) for i in range(num_shards)]
+        self._threads = []
+        for shard in self._shards:
+            thread = threading.Thread(target=self._shard_worker, args=(shard,),
+                                      name=f"crm-shard-{shard.index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, user_query: str, priority: int = 0,
+               timeout: Optional[float] = None, block: bool = True) -> Future:
+        """Queue a request, returning a future for its workflow result
+
+        Waits for a free slot when max_in_flight requests are running (raises
+        ExecutorFull instead with block=False). priority only orders the
+        planning call in the LLM scheduler; the HubSpot phase always runs in
+        submission order, so a request never overtakes an earlier one there.
+        The timeout starts now, so time spent queued counts against it.
+        """
+        if not self._slots.acquire(blocking=block):
+            raise ExecutorFull(f"{self.max_in_flight} requests already in flight")
+        future: Future = Future()
+        future.add_done_callback(self._finish)
+        error = None
+        with self._lock:
+            if self._shutdown:
+                self._slots.release()
+                raise RuntimeError("Executor has been shut down")
+            seq = self._next_submit
+            self._next_submit += 1
+            self._submitted_at[seq] = time.monotonic()
+            self._in_flight += 1
+            # Queue the plan under the lock: shutdown() sets the flag under
+            # the same lock, so the pool cannot close between seq and submit
+            try:
+                self._pool.submit(self._plan, seq, user_query, priority,
+                                  make_deadline(timeout), future)
+            except RuntimeError as e:
+                error = e
+        if error is not None:
+            # Fill the gap so later requests are not stuck behind this seq
+            future.set_result({"status": "error", "error": str(error), "original_query": user_query})
+            self._release_in_order(seq, None, future)
+        return future
+
+    def execute_all(self, user_queries: List[str], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Run a batch of requests, returning results in submission order"""
+        futures = [self.submit(query, timeout=timeout) for query in user_queries]
+        return [future.result() for future in futures]
+
+    def shard_for(self, key: Optional[str], seq: int) -> _Shard:
+        """Shard a key maps to; keyless requests are spread round robin"""
+        if key is None:
+            return self._shards[seq % len(self._shards)]
+        return self._shards[zlib.crc32(key.encode("utf-8")) % len(self._shards)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-shard queue depth and load skew for monitoring
+
+        Skew is the largest value over the mean across shards: 1.0 is an even
+        spread, higher values point at hot entities. oldest_pending_seq and
+        oldest_pending_age show the request holding up dispatch: while it is
+        still planning, every later plan waits in awaiting_order.
+        """
+        shards = [{
+            "shard": shard.index,
+            "queue_depth": shard.queue.qsize(),
+            "max_queue_depth": shard.max_depth,
+            "processed": shard.processed,
+            "busy": shard.busy
+        } for shard in self._shards]
+        with self._lock:
+            awaiting_order = len(self._planned)
+            undispatched = self._next_submit - self._next_dispatch
+            in_flight = self._in_flight
+            oldest_seq = self._next_dispatch if undispatched else None
+            oldest_age = None
+            if oldest_seq is not None:
+                oldest_age = round(time.monotonic() - self._submitted_at[oldest_seq], 3)
+        return {
+            "shards": shards,
+            "queue_depth_skew": _skew([s["queue_depth"] for s in shards]),
+            "processed_skew": _skew([s["processed"] for s in shards]),
+            "in_flight": in_flight,
+            "max_in_flight": self.max_in_flight,
+            "awaiting_order": awaiting_order,
+            "planning": undispatched - awaiting_order,
+            "oldest_pending_seq": oldest_seq,
+            "oldest_pending_age": oldest_age
+        }
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting requests; queued requests still run to completion"""
+        with self._lock:
+            self._shutdown = True
+        if wait:
+            self._drain()
+        else:
+            threading.Thread(target=self._drain, name="crm-drain", daemon=True).start()
+
+    def _drain(self):
+        # Planning must finish first so every request reaches its shard
+        # before the shard is told to stop
+        self._pool.shutdown(wait=True)
+        for shard in self._shards:
+            shard.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        # Shards are done, so no notification can be submitted any more
+        self._notify_pool.shutdown(wait=True)
+
+    def _finish(self, future: Future):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _plan(self, seq: int, user_query: str, priority: int,
+              deadline: Optional[float], future: Future):
+        try:
+            state = self.workflow.plan(user_query, priority=priority, deadline=deadline)
+        except Exception as e:
+            self.logger.error(f"Planning failed: {str(e)}")
+            state = None
+            future.set_result({"status": "error", "error": str(e), "original_query": user_query})
+        self._release_in_order(seq, state, future)
+
+    def _release_in_order(self, seq: int, state: Optional[Dict[str, Any]], future: Future):
+        """Dispatch planned requests to their shards in submission order"""
+        with self._lock:
+            self._planned[seq] = (state, future)
+            while self._next_dispatch in self._planned:
+                state, future = self._planned.pop(self._next_dispatch)
+                del self._submitted_at[self._next_dispatch]
+                if state is not None:
+                    shard = self.shard_for(entity_key(state.get("task_plan")), self._next_dispatch)
+                    shard.queue.put((state, future))
+                    shard.max_depth = max(shard.max_depth, shard.queue.qsize())
+                self._next_dispatch += 1
+
+    def _shard_worker(self, shard: _Shard):
+        while True:
+            item = shard.queue.get()
+            if item is None:
+                break
+            state, future = item
+            shard.busy = True
+            try:
+                state = self.workflow.run_hubspot(state)
+            except Exception as e:
+                self.logger.error(f"HubSpot phase failed: {str(e)}")
+                future.set_result({"status": "error", "error": str(e),
+                                   "original_query": state.get("user_query")})
+                continue
+            finally:
+                shard.processed += 1
+                shard.busy = False
+            self._notify_pool.submit(self._notify, state, future)
+
+    def _notify(self, state: Dict[str, Any], future: Future):
+        try:
+            future.set_result(self.workflow.notify(state))
+        except Exception as e:
+            self.logger.error(f"Notification phase failed: {str(e)}")
+            future.set_result({"status": "error", "error": str(e),
+                               "original_query": state.get("user_query")})
+
+def _skew(values: List[int]) -> float:
+    mean = sum(values) / len(values) if values else 0
+    return max(values) / mean if mean else 0.0
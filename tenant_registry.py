@@ -0,0 +1,298 @@
+## tenant_registry.py
+from typing import Dict, Any, Optional, Callable, List, Tuple
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.cookiejar import DefaultCookiePolicy
+from langchain_openai import ChatOpenAI
+from workflow import CRMWorkflow, build_workflow_graph
+from llm_scheduler import LLMScheduler, scheduled_client_kwargs
+import json
+import logging
+import os
+import threading
+import time
+import requests
+
+class SharedResources:
+    """Heavy resources shared by all tenant workflows in one process"""
+
+    def __init__(self, pool_maxsize: int = 50):
+        # One compiled graph serves every tenant
+        self.graph = build_workflow_graph()
+
+        # One HTTP session (connection pool) for HubSpot and Elastic Email,
+        # credentials travel with each request so tenants can share it. The
+        # cookie jar would be shared too, so it accepts no cookies
+        self.session = requests.Session()
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # LLM clients and schedulers keyed by (API key, model), since OpenAI
+        # rate limits apply per model. Clients are stored as [client, tenant
+        # count] and dropped when the last tenant using them is evicted.
+        # Schedulers are small and kept for the life of the process: a
+        # request of an evicted tenant may still be running on the old one,
+        # and two schedulers for one key would each spend the full budget
+        self._llms: Dict[Tuple[str, str], list] = {}
+        self._schedulers: Dict[Tuple[str, str], LLMScheduler] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, config: Dict[str, Any]) -> Tuple[ChatOpenAI, LLMScheduler]:
+        """Return the LLM client and scheduler for the tenant's OpenAI credentials
+
+        Every acquire must be paired with a release once the tenant is gone.
+        """
+        key = (config["openai"]["api_key"], config["openai"]["model"])
+        with self._lock:
+            entry = self._llms.get(key)
+            if entry is None:
+                llm = ChatOpenAI(api_key=key[0], model=key[1], temperature=0.1,
+                                 **scheduled_client_kwargs(ChatOpenAI))
+                entry = self._llms[key] = [llm, 0]
+            entry[1] += 1
+            llm = entry[0]
+
+            scheduler = self._schedulers.get(key)
+            if scheduler is None:
+                scheduler = self._schedulers[key] = LLMScheduler.from_config(config)
+            return llm, scheduler
+
+    def release(self, config: Dict[str, Any]):
+        """Drop one tenant's reference to its LLM client"""
+        key = (config["openai"]["api_key"], config["openai"]["model"])
+        with self._lock:
+            entry = self._llms.get(key)
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self._llms[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of live shared clients"""
+        with self._lock:
+            return {
+                "llm_clients": len(self._llms),
+                "schedulers": len(self._schedulers)
+            }
+
+    def close(self):
+        """Release pooled connections"""
+        self.session.close()
+
+class _Tenant:
+    """A built tenant workflow and its bookkeeping"""
+
+    def __init__(self, workflow: CRMWorkflow, config: Dict[str, Any], memory_mb: float):
+        self.workflow = workflow
+        self.config = config
+        self.memory_mb = memory_mb
+        self.last_used = time.monotonic()
+
+class TenantRegistry:
+    """Lazily builds one CRMWorkflow per tenant and evicts idle tenants (LRU)
+
+    max_memory_mb caps the summed memory cost of the cached tenants. Each
+    tenant costs tenant_memory_mb, or the "memory_mb" value of its config for
+    tenants known to be heavier; shared resources are not counted. With an
+    idle_ttl, a background thread evicts idle tenants every sweep_interval
+    seconds (idle_ttl / 2 by default) until close() is called.
+    """
+
+    def __init__(self, config_dir: str = "tenants",
+                 config_loader: Optional[Callable[[str], Dict[str, Any]]] = None,
+                 max_tenants: int = 100, max_memory_mb: Optional[float] = None,
+                 tenant_memory_mb: float = 10.0, idle_ttl: Optional[float] = None,
+                 sweep_interval: Optional[float] = None,
+                 resources: Optional[SharedResources] = None):
+        self.config_dir = config_dir
+        self.config_loader = config_loader or self._load_config
+        self.max_tenants = max_tenants
+        self.max_memory_mb = max_memory_mb
+        self.tenant_memory_mb = tenant_memory_mb
+        self.idle_ttl = idle_ttl
+        self.resources = resources or SharedResources()
+
+        # tenant_id -> _Tenant, ordered least recently used first
+        self._tenants: "OrderedDict[str, _Tenant]" = OrderedDict()
+        # tenant_id -> Future of a build in progress, so a tenant is built once
+        self._building: Dict[str, Future] = {}
+        # Guards the two dicts above only, never held while building
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+        self._closed = threading.Event()
+        if idle_ttl is not None:
+            interval = sweep_interval if sweep_interval is not None else max(idle_ttl / 2, 1.0)
+            threading.Thread(target=self._sweep, args=(interval,),
+                             name="tenant-idle-sweep", daemon=True).start()
+
+    def _sweep(self, interval: float):
+        while not self._closed.wait(interval):
+            try:
+                self.evict_idle()
+            except Exception as e:
+                self.logger.error(f"Idle sweep failed: {str(e)}")
+
+    def close(self):
+        """Stop the idle sweep thread"""
+        self._closed.set()
+
+    def _load_config(self, tenant_id: str) -> Dict[str, Any]:
+        """Load the tenant's config from <config_dir>/<tenant_id>.json"""
+        if os.path.basename(tenant_id) != tenant_id or tenant_id in ("", ".", ".."):
+            raise ValueError(f"Invalid tenant id: {tenant_id}")
+        with open(os.path.join(self.config_dir, f"{tenant_id}.json"), 'r') as f:
+            return json.load(f)
+
+    def get(self, tenant_id: str) -> CRMWorkflow:
+        """Return the tenant's workflow, building it on first use"""
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+            if tenant is not None:
+                tenant.last_used = time.monotonic()
+                self._tenants.move_to_end(tenant_id)
+                return tenant.workflow
+            future = self._building.get(tenant_id)
+            owner = future is None
+            if owner:
+                future = self._building[tenant_id] = Future()
+
+        if not owner:
+            # Another thread is building this tenant
+            return future.result()
+
+        try:
+            tenant = self._build(tenant_id)
+        except Exception as e:
+            with self._lock:
+                del self._building[tenant_id]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._building[tenant_id]
+            self._tenants[tenant_id] = tenant
+            evicted = self._evict(keep=tenant_id)
+        self._release(evicted)
+        future.set_result(tenant.workflow)
+        return tenant.workflow
+
+    def _build(self, tenant_id: str) -> _Tenant:
+        config = self.config_loader(tenant_id)
+        llm, scheduler = self.resources.acquire(config)
+        try:
+            workflow = CRMWorkflow(
+                config=config,
+                llm=llm,
+                scheduler=scheduler,
+                session=self.resources.session,
+                graph=self.resources.graph
+            )
+        except Exception:
+            self.resources.release(config)
+            raise
+        memory_mb = float(config.get("memory_mb", self.tenant_memory_mb))
+        self.logger.info(f"Built workflow for tenant: {tenant_id}")
+        return _Tenant(workflow, config, memory_mb)
+
+    def execute(self, tenant_id: str, user_query: str, priority: int = 0,
+                timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Execute a query against the tenant's workflow"""
+        try:
+            workflow = self.get(tenant_id)
+        except Exception as e:
+            self.logger.error(f"Failed to load tenant {tenant_id}: {str(e)}")
+            return {
+                "status": "error",
+                "error": str(e),
+                "original_query": user_query
+            }
+        return workflow.execute(user_query, priority=priority, timeout=timeout)
+
+    def evict(self, tenant_id: str) -> bool:
+        """Drop a tenant's workflow, e.g. after its config changed"""
+        with self._lock:
+            tenant = self._tenants.pop(tenant_id, None)
+        if tenant is None:
+            return False
+        self._release([(tenant_id, tenant, "requested")])
+        return True
+
+    def evict_idle(self) -> int:
+        """Drop tenants unused for longer than idle_ttl, returns the count"""
+        with self._lock:
+            evicted = self._evict_idle()
+        self._release(evicted)
+        return len(evicted)
+
+    def _evict_idle(self, keep: Optional[str] = None) -> List[Tuple[str, _Tenant, str]]:
+        evicted = []
+        if self.idle_ttl is None:
+            return evicted
+        cutoff = time.monotonic() - self.idle_ttl
+        for tenant_id, tenant in list(self._tenants.items()):
+            if tenant.last_used > cutoff:
+                break
+            if tenant_id == keep:
+                continue
+            del self._tenants[tenant_id]
+            evicted.append((tenant_id, tenant, "idle"))
+        return evicted
+
+    def _evict(self, keep: str) -> List[Tuple[str, _Tenant, str]]:
+        """Evict idle tenants, then least recently used ones over the caps
+
+        Called with the lock held; the evicted tenants are returned so their
+        shared resources can be released after the lock is dropped. The
+        tenant just built (keep) is never evicted, whatever the caps.
+        """
+        evicted = self._evict_idle(keep)
+        while len(self._tenants) > max(self.max_tenants, 1):
+            evicted.append(self._pop_lru(keep, "max tenants"))
+        if self.max_memory_mb is not None:
+            while len(self._tenants) > 1 and self._memory_mb() > self.max_memory_mb:
+                evicted.append(self._pop_lru(keep, "memory"))
+        return evicted
+
+    def _pop_lru(self, keep: str, reason: str) -> Tuple[str, _Tenant, str]:
+        tenant_id = next(t for t in self._tenants if t != keep)
+        return (tenant_id, self._tenants.pop(tenant_id), reason)
+
+    def _memory_mb(self) -> float:
+        """Summed memory cost of the cached tenants"""
+        return sum(t.memory_mb for t in self._tenants.values())
+
+    def _release(self, evicted: List[Tuple[str, _Tenant, str]]):
+        for tenant_id, tenant, reason in evicted:
+            self.resources.release(tenant.config)
+            self.logger.info(f"Evicted tenant ({reason}): {tenant_id}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Registry statistics for monitoring"""
+        with self._lock:
+            stats = {
+                "tenants": len(self._tenants),
+                "building": len(self._building),
+                "max_tenants": self.max_tenants,
+                "tenant_memory_mb": round(self._memory_mb(), 1),
+                "rss_mb": _current_rss_mb()
+            }
+        stats.update(self.resources.stats())
+        return stats
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    def __contains__(self, tenant_id: str) -> bool:
+        return tenant_id in self._tenants
+
+def _current_rss_mb() -> Optional[float]:
+    """Current resident memory of this process in MB (None if unavailable)"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
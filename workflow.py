@@ -1,140 +1,221 @@
 ## workflow.py
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from langgraph.graph import Graph, END
 from agents.orchestrator_agent import OrchestratorAgent
 from agents.hubspot_agent import HubSpotAgent
 from agents.email_agent import EmailAgent
+from llm_scheduler import LLMScheduler
+from deadline import DeadlineExceeded, make_deadline, timeout_for, expired
 import json
 import logging
+import requests
+
+# State key holding each node's result
+NODE_RESULT_KEYS = {
+    "orchestrator": "orchestrator_result",
+    "hubspot_operation": "hubspot_result",
+    "send_email": "email_result"
+}
+
+def build_workflow_graph() -> Graph:
+    """Build the LangGraph workflow
+
+    The compiled graph holds no tenant state: every node dispatches to the
+    CRMWorkflow instance carried in the state under "workflow", so a single
+    compiled graph can be shared by any number of workflows.
+    """
+    
+    def orchestrator_node(state: Dict[str, Any]) -> Dict[str, Any]:
+        return state["workflow"]._run_node("orchestrator", state)
+    
+    def hubspot_node(state: Dict[str, Any]) -> Dict[str, Any]:
+        return state["workflow"]._run_node("hubspot_operation", state)
+    
+    def email_node(state: Dict[str, Any]) -> Dict[str, Any]:
+        return state["workflow"]._run_node("send_email", state)
+    
+    def should_send_email(state: Dict[str, Any]) -> str:
+        return state["workflow"]._should_send_email(state)
+    
+    # Build the graph
+    workflow = Graph()
+    
+    # Add nodes
+    workflow.add_node("orchestrator", orchestrator_node)
+    workflow.add_node("hubspot_operation", hubspot_node)
+    workflow.add_node("send_email", email_node)
+    
+    # Add edges
+    workflow.add_edge("orchestrator", "hubspot_operation")
+    workflow.add_conditional_edges(
+        "hubspot_operation",
+        should_send_email,
+        {
+            "send_email": "send_email",
+            "end": END
+        }
+    )
+    workflow.add_edge("send_email", END)
+    
+    # Set entry point
+    workflow.set_entry_point("orchestrator")
+    
+    # Return the compiled workflow
+    return workflow.compile()
 
 class CRMWorkflow:
     """Main workflow orchestrator using LangGraph"""
     
-    def __init__(self, config_path: str = "config.json"):
-        # Load configuration
-        with open(config_path, 'r') as f:
-            self.config = json.load(f)
+    def __init__(self, config_path: str = "config.json", config: Optional[Dict[str, Any]] = None,
+                 llm: Optional[Any] = None, session: Optional[requests.Session] = None,
+                 graph: Optional[Graph] = None, scheduler: Optional[LLMScheduler] = None):
+        # Load configuration (an already loaded config takes precedence)
+        if config is None:
+            with open(config_path, 'r') as f:
+                config = json.load(f)
+        self.config = config
         
-        # Initialize agents
-        self.orchestrator = OrchestratorAgent(self.config)
-        self.hubspot_agent = HubSpotAgent(self.config)
-        self.email_agent = EmailAgent(self.config)
+        # Initialize agents, reusing shared clients when provided
+        self.orchestrator = OrchestratorAgent(self.config, llm=llm, scheduler=scheduler)
+        self.hubspot_agent = HubSpotAgent(self.config, session=session)
+        self.email_agent = EmailAgent(self.config, session=session)
         
         # Setup logging
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
         
         # Build workflow graph
-        self.workflow = self._build_workflow()
+        self.workflow = graph or build_workflow_graph()
     
-    def _build_workflow(self) -> Graph:
-        """Build the LangGraph workflow"""
+    def _run_node(self, node: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a node unless the request deadline has passed, tracking progress"""
+        result_key = NODE_RESULT_KEYS[node]
+        deadline = state.get("deadline")
+        if expired(deadline):
+            self.logger.warning(f"Deadline exceeded, skipping node: {node}")
+            return {
+                **state,
+                result_key: {"status": "skipped", "message": "Deadline exceeded"},
+                "skipped_nodes": state.get("skipped_nodes", []) + [node]
+            }
         
-        def orchestrator_node(state: Dict[str, Any]) -> Dict[str, Any]:
-            """Orchestrator node - analyzes query and creates task plan"""
-            user_query = state["user_query"]
-            # Use try/except to handle the function call safely
-            try:
-                result = self.orchestrator.execute(user_query)
-                return {
-                    **state,
-                    "orchestrator_result": result,
-                    "task_plan": result.get("task_plan"),
-                    "original_query": user_query
-                }
-            except Exception as e:
-                self.logger.error(f"Error in orchestrator node: {str(e)}")
-                return {
-                    **state,
-                    "error": str(e),
-                    "task_plan": None,
-                    "original_query": user_query
-                }
+        handlers = {
+            "orchestrator": self._orchestrator_node,
+            "hubspot_operation": self._hubspot_node,
+            "send_email": self._email_node
+        }
+        try:
+            new_state = handlers[node](state)
+        except (DeadlineExceeded, requests.Timeout) as e:
+            self.logger.error(f"Node {node} cut short by deadline: {str(e)}")
+            new_state = {
+                **state,
+                result_key: {"status": "error", "error": str(e), "deadline_exceeded": True}
+            }
         
-        def hubspot_node(state: Dict[str, Any]) -> Dict[str, Any]:
-            """HubSpot node - executes CRM operations"""
-            task_plan = state.get("task_plan")
-            if not task_plan:
-                return {
-                    **state,
-                    "hubspot_result": {"status": "error", "error": "No task plan available"}
-                }
-            
-            result = self.hubspot_agent.execute(task_plan)
+        # Only a node stopped by the deadline counts as cancelled, not one
+        # that failed for other reasons after it passed
+        result = new_state.get(result_key) or {}
+        if result.get("deadline_exceeded"):
+            progress_key = "cancelled_nodes"
+        else:
+            progress_key = "completed_nodes"
+        return {
+            **new_state,
+            progress_key: state.get(progress_key, []) + [node]
+        }
+    
+    def _orchestrator_node(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Orchestrator node - analyzes query and creates task plan"""
+        user_query = state["user_query"]
+        # Use try/except to handle the function call safely
+        try:
+            result = self.orchestrator.execute(
+                user_query,
+                priority=state.get("priority", 0),
+                deadline=state.get("deadline")
+            )
             return {
                 **state,
-                "hubspot_result": result,
-                "operation_result": result
+                "orchestrator_result": result,
+                "task_plan": result.get("task_plan"),
+                "original_query": user_query
             }
-        
-        def email_node(state: Dict[str, Any]) -> Dict[str, Any]:
-            """Email node - sends notification"""
-            task_plan = state.get("task_plan", {})
-            operation_result = state.get("operation_result", {})
-            original_query = state.get("original_query", "")
-            
-            if not task_plan.get("send_notification", True):
-                return {
-                    **state,
-                    "email_result": {"status": "skipped", "message": "Notification disabled"}
-                }
-            
-            email_task = {
-                "operation_result": operation_result,
-                "notification_details": task_plan.get("notification_details", {}),
-                "original_query": original_query
+        except Exception as e:
+            self.logger.error(f"Error in orchestrator node: {str(e)}")
+            return {
+                **state,
+                "error": str(e),
+                "task_plan": None,
+                "original_query": user_query
             }
-            
-            result = self.email_agent.execute(email_task)
+    
+    def _hubspot_node(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """HubSpot node - executes CRM operations"""
+        task_plan = state.get("task_plan")
+        if not task_plan:
+            orchestrator_error = (state.get("orchestrator_result") or {}).get("error")
             return {
                 **state,
-                "email_result": result
+                "hubspot_result": {"status": "error", "error": orchestrator_error or "No task plan available"}
             }
         
-        def should_send_email(state: Dict[str, Any]) -> str:
-            """Conditional edge - decide whether to send email"""
-            task_plan = state.get("task_plan", {})
-            hubspot_result = state.get("hubspot_result", {})
-            
-            # Send email if notification is enabled and HubSpot operation completed
-            if task_plan.get("send_notification", True) and hubspot_result.get("status"):
-                return "send_email"
-            else:
-                return "end"
-        
-        # Build the graph
-        workflow = Graph()
-        
-        # Add nodes
-        workflow.add_node("orchestrator", orchestrator_node)
-        workflow.add_node("hubspot_operation", hubspot_node)
-        workflow.add_node("send_email", email_node)
+        result = self.hubspot_agent.execute(task_plan, timeout=timeout_for(state.get("deadline")))
+        return {
+            **state,
+            "hubspot_result": result,
+            "operation_result": result
+        }
+    
+    def _email_node(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Email node - sends notification"""
+        task_plan = state.get("task_plan") or {}
+        operation_result = state.get("operation_result", {})
+        original_query = state.get("original_query", "")
         
-        # Add edges
-        workflow.add_edge("orchestrator", "hubspot_operation")
-        workflow.add_conditional_edges(
-            "hubspot_operation",
-            should_send_email,
-            {
-                "send_email": "send_email",
-                "end": END
+        if not task_plan.get("send_notification", True):
+            return {
+                **state,
+                "email_result": {"status": "skipped", "message": "Notification disabled"}
             }
-        )
-        workflow.add_edge("send_email", END)
         
-        # Set entry point
-        workflow.set_entry_point("orchestrator")
+        email_task = {
+            "operation_result": operation_result,
+            "notification_details": task_plan.get("notification_details", {}),
+            "original_query": original_query
+        }
+        
+        result = self.email_agent.execute(email_task, timeout=timeout_for(state.get("deadline")))
+        return {
+            **state,
+            "email_result": result
+        }
+    
+    def _should_send_email(self, state: Dict[str, Any]) -> str:
+        """Conditional edge - decide whether to send email"""
+        task_plan = state.get("task_plan") or {}
+        hubspot_result = state.get("hubspot_result", {})
         
-        # Return the compiled workflow
-        return workflow.compile()
+        # Send email if notification is enabled and HubSpot operation completed
+        if task_plan.get("send_notification", True) and hubspot_result.get("status"):
+            return "send_email"
+        else:
+            return "end"
     
-    def execute(self, user_query: str) -> Dict[str, Any]:
-        """Execute the complete workflow"""
+    def execute(self, user_query: str, priority: int = 0,
+                timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Execute the complete workflow
+
+        Higher priority requests get their planning call admitted first when
+        the OpenAI rate limit budgets are contended. With a timeout (seconds),
+        outbound calls are bounded by the time left and nodes reached after
+        it ran out are skipped; the result then has status "partial".
+        """
         try:
             self.logger.info(f"Starting workflow for query: {user_query}")
             
             # Initialize state
-            initial_state = {"user_query": user_query}
+            initial_state = self._initial_state(user_query, priority, timeout)
             
             # Execute workflow
             try:
@@ -149,14 +230,7 @@ class CRMWorkflow:
                     raise ValueError("Workflow graph is not properly compiled or initialized")
             
             # Prepare response
-            response = {
-                "status": "completed",
-                "original_query": user_query,
-                "task_plan": final_state.get("task_plan"),
-                "hubspot_result": final_state.get("hubspot_result"),
-                "email_result": final_state.get("email_result"),
-                "workflow_successful": self._is_workflow_successful(final_state)
-            }
+            response = self._build_response(final_state)
             
             self.logger.info(f"Workflow completed: {response['workflow_successful']}")
             return response
@@ -169,6 +243,55 @@ class CRMWorkflow:
                 "original_query": user_query
             }
     
+    def plan(self, user_query: str, priority: int = 0, timeout: Optional[float] = None,
+             deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Run the planning phase only, returning the state for run_hubspot
+
+        plan, run_hubspot and notify run the same nodes as execute, one phase
+        at a time, for executors that schedule the phases themselves. Such
+        executors should pass the absolute deadline computed when the request
+        was accepted, so time spent queued counts against it.
+        """
+        state = self._initial_state(user_query, priority, timeout, deadline)
+        return self._run_node("orchestrator", state)
+    
+    def run_hubspot(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the HubSpot phase on a planned state"""
+        return self._run_node("hubspot_operation", state)
+    
+    def notify(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the notification phase if needed and build the response"""
+        if self._should_send_email(state) == "send_email":
+            state = self._run_node("send_email", state)
+        return self._build_response(state)
+    
+    def _initial_state(self, user_query: str, priority: int, timeout: Optional[float],
+                       deadline: Optional[float] = None) -> Dict[str, Any]:
+        return {
+            "user_query": user_query,
+            "workflow": self,
+            "priority": priority,
+            "deadline": deadline if deadline is not None else make_deadline(timeout),
+            "completed_nodes": [],
+            "skipped_nodes": [],
+            "cancelled_nodes": []
+        }
+    
+    def _build_response(self, final_state: Dict[str, Any]) -> Dict[str, Any]:
+        deadline_exceeded = bool(final_state.get("skipped_nodes") or final_state.get("cancelled_nodes"))
+        return {
+            "status": "partial" if deadline_exceeded else "completed",
+            "original_query": final_state["user_query"],
+            "task_plan": final_state.get("task_plan"),
+            "hubspot_result": final_state.get("hubspot_result"),
+            "email_result": final_state.get("email_result"),
+            "workflow_successful": self._is_workflow_successful(final_state),
+            "deadline_exceeded": deadline_exceeded,
+            "completed_nodes": final_state.get("completed_nodes", []),
+            "skipped_nodes": final_state.get("skipped_nodes", []),
+            "cancelled_nodes": final_state.get("cancelled_nodes", [])
+        }
+    
     def _is_workflow_successful(self, state: Dict[str, Any]) -> bool:
         """Check if the overall workflow was successful"""
         hubspot_result = state.get("hubspot_result", {})